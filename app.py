@@ -1,24 +1,92 @@
 import asyncio
-from gpt_researcher import GPTResearcher
+import json
+from contextlib import closing
+from operator import itemgetter
+import math
+import sqlite3
+import threading
 import re
+import httpx
+import pandas as pd
 import streamlit as st
-from dotenv import load_dotenv
-from pydantic import BaseModel, EmailStr, HttpUrl, Field, validator
+from pydantic import BaseModel, EmailStr, HttpUrl, Field, field_validator
 from typing import List, Optional
-from datetime import date, datetime
-from prettytable import PrettyTable
+from datetime import datetime
 
-# Load environment variables
-load_dotenv()
 
-from langchain_openai import ChatOpenAI
+# Load environment variables once per process rather than on every rerun
+@st.cache_resource
+def _load_env_once():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return True
+
+
+_load_env_once()
+
 import os
 
-llm = ChatOpenAI(
-    openai_api_base="https://api.openai.com/v1",
-    openai_api_key=os.getenv("OPENAI_API_KEY"),
-    model_name="gpt-4o-mini",
+
+# Streamlit re-executes this script on every interaction, so clients are
+# built once per process and shared across reruns
+@st.cache_resource
+def get_event_loop():
+    # One long-lived loop owns every outbound call so pooled connections survive clicks
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+@st.cache_resource
+def get_http_client():
+    return httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=32))
+
+
+@st.cache_resource
+def get_llm():
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        openai_api_base="https://api.openai.com/v1",
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        model_name="gpt-4o-mini",
+        http_async_client=get_http_client(),
+    )
+
+
+@st.cache_resource
+def get_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(
+        openai_api_base="https://api.openai.com/v1",
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        http_async_client=get_http_client(),
+    )
+
+
+CACHE_PATH = os.getenv("RESEARCH_CACHE_PATH", "research_cache.sqlite3")
+CACHE_SIMILARITY_THRESHOLD = 0.9
+BATCH_MAX_CONCURRENCY = 16
+
+# st.dataframe only wraps cell text once rows are taller than 4rem (64px at the
+# default 16px root font). Above that, each wrapped line of the 14px grid font
+# needs about 21px, and a "large" Details column fits roughly 50 characters
+GRID_WRAP_MIN_ROW_HEIGHT = 65
+GRID_LINE_HEIGHT = 21
+GRID_CELL_PADDING = 16
+DETAILS_CHARS_PER_LINE = 50
+# height="content" is capped at 10,000px, shared by the header and every row
+GRID_MAX_CONTENT_HEIGHT = 10_000
+
+_CITATION_RE = re.compile(r"\[(.*?)\]\((https?://\S+)\)")
+_NON_ALNUM_RE = re.compile(r"[^a-zA-Z0-9]")
+_ASCII_NON_ALNUM_TABLE = str.maketrans(
+    "", "", "".join(c for c in map(chr, range(128)) if not c.isalnum())
 )
+_DIRECTOR_SPLIT_RE = re.compile(r"[,;]| and ")
+_LIKE_WILDCARD_RE = re.compile(r"([\\%_])")
 
 
 class ContactInformation(BaseModel):
@@ -26,21 +94,24 @@ class ContactInformation(BaseModel):
     phone: Optional[str] = Field(None, description="Company phone number")
     website: Optional[str] = Field(None, description="Company website URL")
 
-    @validator("email")
+    @field_validator("email", mode="after")
     def validate_email(cls, v):
-        if v is None or v.strip() == "":
+        if not v:
             return None
-        if v and "@" in v and "." in v:
-            return v
-        return None
+        vs = v.strip()
+        if not vs:
+            return None
+        at = vs.find("@")
+        return vs if at > 0 and vs.find(".", at) > 0 else None
 
-    @validator("website")
+    @field_validator("website", mode="after")
     def validate_website(cls, v):
-        if v is None or v.strip() == "":
+        if not v:
             return None
-        if v and ("http://" in v or "https://" in v):
-            return v
-        return None
+        vs = v.strip()
+        if not vs:
+            return None
+        return vs if vs.startswith(("http://", "https://")) else None
 
 
 class CompanyInformation(BaseModel):
@@ -72,133 +143,384 @@ class CompanyInformation(BaseModel):
         ..., description="Latest reported revenue information"
     )
 
-    @validator("registration_number")
+    @field_validator("registration_number", mode="after")
     def validate_registration_number(cls, v):
-        if v is None or v.strip() == "":
+        if v is None or v.strip() in ("", "Information not available"):
             return "Information not available"
         # Remove common separators and clean up
-        cleaned = re.sub(r"[^a-zA-Z0-9]", "", v)
+        # translate covers the common ASCII case; the regex also drops non-ASCII
+        if v.isascii():
+            cleaned = v.translate(_ASCII_NON_ALNUM_TABLE)
+        else:
+            cleaned = _NON_ALNUM_RE.sub("", v)
         return cleaned if cleaned else "Information not available"
 
-    @validator("directors_shareholders", pre=True)
+    @field_validator("directors_shareholders", mode="before")
     def parse_directors(cls, v):
         if isinstance(v, list):
             return v
         if isinstance(v, str):
-            directors = [d.strip() for d in re.split(r"[,;]|\band\b", v) if d.strip()]
+            directors = [d.strip() for d in _DIRECTOR_SPLIT_RE.split(v) if d.strip()]
             return directors or ["Information not available"]
         return ["Information not available"]
 
 
-def sanitize_string(s: str) -> str:
-    if not s:
-        return "Information not available"
-    return s.strip() or "Information not available"
+@st.cache_resource
+def get_structured_llm():
+    return get_llm().with_structured_output(CompanyInformation)
+
+
+# (table label, CompanyInformation key) in display order; contact keys are flattened
+_FIELDS = (
+    ("Primary Address", "primary_address"),
+    ("Registration Number", "registration_number"),
+    ("Legal Form", "legal_form"),
+    ("Country", "country"),
+    ("Town", "town"),
+    ("Registration Date", "registration_date"),
+    ("Email", "email"),
+    ("Phone", "phone"),
+    ("Website", "website"),
+    ("General Details", "general_details"),
+    ("Directors & Shareholders", "directors_shareholders"),
+    ("UBO", "ubo"),
+    ("Subsidiaries", "subsidiaries"),
+    ("Parent Company", "parent_company"),
+    ("Last Reported Revenue", "last_reported_revenue"),
+)
+_FIELD_LABELS = [label for label, _ in _FIELDS]
+_GET_ROW = itemgetter(*(key for _, key in _FIELDS))
+
+
+def extract_citations(text: str):
+    # Strip inline markdown citations, returning (cleaned_text, references)
+    parts = []
+
+    def _grab(m):
+        parts.append(f"- {m.group(1).strip()} {m.group(2)}")
+        return ""
+
+    cleaned = _CITATION_RE.sub(_grab, text).strip()
+    return cleaned, "\n".join(parts)
 
 
 async def generate_evidence(query: str):
     try:
+        from gpt_researcher import GPTResearcher
+
         researcher = GPTResearcher(
             query=query, report_type="research_report", config_path=None
         )
         await researcher.conduct_research()
         report = await researcher.write_report()
 
-        split_text = report.split("## References")
-        main_text = split_text[0].strip()
+        # Section the report by heading offsets instead of materializing split lists
+        main_text, references_heading, references_section = report.partition(
+            "## References"
+        )
+        main_text = main_text.partition("## Conclusion")[0].strip()
 
-        if "## Conclusion" in main_text:
-            main_text = main_text.split("## Conclusion")[0].strip()
+        main_text, references = extract_citations(main_text)
 
-        citation_pattern = r"\[(.*?)\]\((https?://\S+)\)"
-        citations = re.findall(citation_pattern, main_text)
+        if references_heading:
+            references += "\n" + references_section.strip()
 
-        references = "\n".join(
-            [
-                f"- {source.strip()} {url.strip().replace(')', '')}"
-                for source, url in citations
-            ]
+        return main_text, references, None
+    except Exception as e:
+        return (
+            "",
+            "No references available due to error",
+            f"Error during research: {str(e)}",
         )
 
-        main_text = re.sub(citation_pattern, "", main_text).strip()
 
-        if len(split_text) > 1:
-            references += "\n" + split_text[1].strip()
+@st.cache_data(max_entries=128)
+def format_company_data_as_frame(company_json: str) -> pd.DataFrame:
+    try:
+        company = json.loads(company_json)
+        company.update(company.pop("contact_information"))
+        company["directors_shareholders"] = ", ".join(company["directors_shareholders"])
+
+        return pd.DataFrame(
+            {
+                "Fields": _FIELD_LABELS,
+                "Details": [
+                    (value or "").strip() or "Information not available"
+                    for value in _GET_ROW(company)
+                ],
+            }
+        )
+    except Exception as e:
+        st.error(f"Error formatting company data: {str(e)}")
+        return pd.DataFrame(
+            {
+                "Fields": ["Error"],
+                "Details": ["Failed to format company information"],
+            }
+        )
+
+
+def details_row_height(company_frame: pd.DataFrame) -> int:
+    # Grid rows share one height, so size them for the longest Details value
+    longest = max((len(value) for value in company_frame["Details"]), default=0)
+    lines = -(-longest // DETAILS_CHARS_PER_LINE)
+    height = max(GRID_WRAP_MIN_ROW_HEIGHT, lines * GRID_LINE_HEIGHT + GRID_CELL_PADDING)
+    return min(height, GRID_MAX_CONTENT_HEIGHT // (len(company_frame) + 1))
+
+
+def _unavailable_company_information():
+    return CompanyInformation(
+        primary_address="Information not available",
+        registration_number="Information not available",
+        legal_form="Information not available",
+        country="Information not available",
+        town="Information not available",
+        registration_date="Information not available",
+        contact_information=ContactInformation(),
+        general_details="Information not available",
+        directors_shareholders=["Information not available"],
+        last_reported_revenue="Information not available",
+    )
 
-        return main_text, references
+
+async def final_output_generation(report):
+    # Returns (company_info, error); error is None unless the fallback was used
+    try:
+        return await get_structured_llm().ainvoke(report), None
     except Exception as e:
-        st.error(f"Error during research: {str(e)}")
-        return "", "No references available due to error"
+        return (
+            _unavailable_company_information(),
+            f"Error processing company information: {str(e)}",
+        )
+
+
+async def final_output_generation_batch(reports):
+    # One pipelined abatch call instead of a serialized invoke per company
+    results = await get_structured_llm().abatch(
+        reports,
+        config={"max_concurrency": BATCH_MAX_CONCURRENCY},
+        return_exceptions=True,
+    )
+    outputs = []
+    for result in results:
+        if isinstance(result, Exception):
+            outputs.append(
+                (
+                    _unavailable_company_information(),
+                    f"Error processing company information: {str(result)}",
+                )
+            )
+        else:
+            outputs.append((result, None))
+    return outputs
+
+
+def _cache_connection():
+    conn = sqlite3.connect(CACHE_PATH)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS research_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cache_key TEXT NOT NULL,
+            embedding TEXT NOT NULL,
+            main_text TEXT NOT NULL,
+            references_text TEXT NOT NULL,
+            company_json TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS research_cache_key ON research_cache (cache_key)"
+    )
+    return conn
+
+
+def _cosine_similarity(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
 
 
-def format_company_data_as_dict(company_info):
+def _cached_row(main_text, references, company_json):
+    # Stored rows were validated before insertion; re-running validators is lossy
+    company = json.loads(company_json)
+    company["contact_information"] = ContactInformation.model_construct(
+        **company["contact_information"]
+    )
+    return main_text, references, CompanyInformation.model_construct(**company)
+
+
+def lookup_cached_research(cache_key):
+    # Latest stored (main_text, references, company_info) for exactly this key
+    with closing(_cache_connection()) as conn:
+        row = conn.execute(
+            "SELECT main_text, references_text, company_json FROM research_cache "
+            "WHERE cache_key = ? ORDER BY id DESC LIMIT 1",
+            (cache_key,),
+        ).fetchone()
+    return _cached_row(*row) if row is not None else None
+
+
+def lookup_similar_research(cache_key, embedding):
+    # Closest stored entry for the same country above the similarity threshold.
+    # Only ids and embeddings are scanned; the payload is fetched for the winner
+    country = cache_key.rpartition("|")[2]
+    pattern = "%|" + _LIKE_WILDCARD_RE.sub(r"\\\1", country)
+    best_score, best_id = 0.0, None
+    with closing(_cache_connection()) as conn:
+        rows = conn.execute(
+            "SELECT id, embedding FROM research_cache "
+            "WHERE cache_key LIKE ? ESCAPE '\\'",
+            (pattern,),
+        )
+        for row_id, stored_embedding in rows:
+            score = _cosine_similarity(embedding, json.loads(stored_embedding))
+            if score > best_score:
+                best_score, best_id = score, row_id
+
+        if best_id is None or best_score < CACHE_SIMILARITY_THRESHOLD:
+            return None
+        row = conn.execute(
+            "SELECT main_text, references_text, company_json FROM research_cache "
+            "WHERE id = ?",
+            (best_id,),
+        ).fetchone()
+    return _cached_row(*row)
+
+
+def store_cached_research(cache_key, embedding, main_text, references, company_info):
+    with closing(_cache_connection()) as conn, conn:
+        conn.execute(
+            "INSERT INTO research_cache "
+            "(cache_key, embedding, main_text, references_text, company_json) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                cache_key,
+                json.dumps(embedding),
+                main_text,
+                references,
+                company_info.model_dump_json(),
+            ),
+        )
+
+
+def _cache_key(company_name: str, country: str) -> str:
+    return f"{company_name.strip()}|{country.strip()}".lower()
+
+
+async def _lookup_cache(cache_key, messages):
+    # Returns (cached, embedding); embedding is None if the cache is unusable.
+    # SQLite reads and the cosine scan block, so keep them off the shared loop
     try:
-        directors_str = ", ".join(company_info.directors_shareholders)
-
-        all_fields = {
-            "Fields": [
-                "Primary Address",
-                "Registration Number",
-                "Legal Form",
-                "Country",
-                "Town",
-                "Registration Date",
-                "Email",
-                "Phone",
-                "Website",
-                "General Details",
-                "Directors & Shareholders",
-                "UBO",
-                "Subsidiaries",
-                "Parent Company",
-                "Last Reported Revenue",
-            ],
-            "Details": [
-                sanitize_string(company_info.primary_address),
-                sanitize_string(company_info.registration_number),
-                sanitize_string(company_info.legal_form),
-                sanitize_string(company_info.country),
-                sanitize_string(company_info.town),
-                company_info.registration_date,
-                sanitize_string(company_info.contact_information.email),
-                sanitize_string(company_info.contact_information.phone),
-                sanitize_string(str(company_info.contact_information.website)),
-                sanitize_string(company_info.general_details),
-                directors_str,
-                sanitize_string(company_info.ubo),
-                sanitize_string(company_info.subsidiaries),
-                sanitize_string(company_info.parent_company),
-                sanitize_string(company_info.last_reported_revenue),
-            ],
-        }
-        return all_fields
+        cached = await asyncio.to_thread(lookup_cached_research, cache_key)
+        if cached is not None:
+            return cached, None
+        embedding = await get_embeddings().aembed_query(cache_key)
+        cached = await asyncio.to_thread(lookup_similar_research, cache_key, embedding)
+        return cached, embedding
     except Exception as e:
-        st.error(f"Error formatting company data: {str(e)}")
-        return {
-            "Fields": ["Error"],
-            "Details": ["Failed to format company information"],
-        }
+        messages.append(("warning", f"Research cache unavailable: {str(e)}"))
+        return None, None
 
 
-def final_output_generation(llm, report):
+async def _store_cache(cache_key, embedding, report, references, result, messages):
+    # Only cache successful research so transient failures are retried
+    if embedding is None or not report:
+        return
     try:
-        structured_llm = llm.with_structured_output(CompanyInformation)
-        result = structured_llm.invoke(report)
-        return result
+        await asyncio.to_thread(
+            store_cached_research, cache_key, embedding, report, references, result
+        )
     except Exception as e:
-        st.error(f"Error processing company information: {str(e)}")
-        return CompanyInformation(
-            primary_address="Information not available",
-            registration_number="Information not available",
-            legal_form="Information not available",
-            country="Information not available",
-            town="Information not available",
-            registration_date=date(1900, 1, 1),
-            contact_information=ContactInformation(),
-            general_details="Information not available",
-            directors_shareholders=["Information not available"],
-            last_reported_revenue="Information not available",
+        messages.append(("warning", f"Failed to update research cache: {str(e)}"))
+
+
+async def cached_research(company_name: str, country: str, query: str):
+    # Returns (report, references, company_info, messages); messages holds
+    # (level, text) pairs for main() to render on the script thread
+    cache_key = _cache_key(company_name, country)
+    messages = []
+
+    cached, embedding = await _lookup_cache(cache_key, messages)
+    if cached is not None:
+        return (*cached, messages)
+
+    report, references, research_error = await generate_evidence(query=query)
+    if research_error or not report:
+        # Nothing to extract from; skip the paid LLM call as batch_research does
+        if research_error:
+            messages.append(("error", research_error))
+        return report, references, _unavailable_company_information(), messages
+
+    result, extraction_error = await final_output_generation(report)
+    if extraction_error:
+        messages.append(("error", extraction_error))
+    else:
+        await _store_cache(cache_key, embedding, report, references, result, messages)
+
+    return report, references, result, messages
+
+
+async def batch_research(companies):
+    # companies holds (company_name, country, query) triples; returns one
+    # cached_research-shaped tuple per company, in order
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def research(company_name, country, query):
+        # Bound concurrent GPTResearcher runs so search providers are not flooded
+        cache_key = _cache_key(company_name, country)
+        messages = []
+        async with semaphore:
+            cached, embedding = await _lookup_cache(cache_key, messages)
+            if cached is not None:
+                return cache_key, embedding, cached, messages
+            report, references, error = await generate_evidence(query=query)
+        if error:
+            messages.append(("error", error))
+        return cache_key, embedding, (report, references, None), messages
+
+    entries = await asyncio.gather(*(research(*company) for company in companies))
+
+    # Cache hits already carry a record and failed research has no report, so
+    # only fresh non-empty reports go to the LLM
+    pending = [
+        i
+        for i, (_, _, (report, _, result), _) in enumerate(entries)
+        if result is None and report
+    ]
+    results = [result for _, _, (_, _, result), _ in entries]
+    if pending:
+        extracted = await final_output_generation_batch(
+            [entries[i][2][0] for i in pending]
         )
+        for i, (result, error) in zip(pending, extracted):
+            cache_key, embedding, (report, references, _), messages = entries[i]
+            results[i] = result
+            if error:
+                messages.append(("error", error))
+            else:
+                await _store_cache(
+                    cache_key, embedding, report, references, result, messages
+                )
+
+    return [
+        (report, references, result or _unavailable_company_information(), messages)
+        for (_, _, (report, references, _), messages), result in zip(entries, results)
+    ]
+
+
+def run_async(coro):
+    # The loop thread is shared by every session, so coroutines submitted here
+    # must return their messages instead of calling st.* themselves
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+def render_messages(messages):
+    for level, text in messages:
+        if level == "error":
+            st.error(text)
+        else:
+            st.warning(text)
 
 
 def main():
@@ -224,13 +546,25 @@ def main():
                 else:
                     query = f"Provide the {company_name} details, including registration number, primary address, legal form, country, town, registration date, contact info, general details, UBO, directors/shareholders, subsidiaries, parent company, and last reported revenue. Make sure to include any company registration or identification numbers."
 
-                report, references = asyncio.run(generate_evidence(query=query))
-                result = final_output_generation(llm, report)
+                report, references, result, messages = run_async(
+                    cached_research(company_name, country, query)
+                )
+                render_messages(messages)
 
-                data_dict = format_company_data_as_dict(result)
+                company_frame = format_company_data_as_frame(result.model_dump_json())
 
                 st.subheader("AI Web Research Agent Result: ")
-                st.table(data_dict)
+                st.dataframe(
+                    company_frame,
+                    width="stretch",
+                    height="content",
+                    hide_index=True,
+                    row_height=details_row_height(company_frame),
+                    column_config={
+                        "Fields": st.column_config.TextColumn(width="medium"),
+                        "Details": st.column_config.TextColumn(width="large"),
+                    },
+                )
 
                 st.subheader("References")
                 st.markdown(references, unsafe_allow_html=True)